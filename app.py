@@ -3,8 +3,18 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
 from datetime import datetime
+import bisect
+import hashlib
+import functools
+
+# 선택 의존성: 대용량 추이 그래프 다운샘플링 (미설치 환경에서는 기본 Figure 사용)
+try:
+    from plotly_resampler import FigureResampler
+except ImportError:
+    FigureResampler = None
 
 # --- 1. 기본 설정 및 상수 정의 ---
 st.set_page_config(
@@ -65,184 +75,336 @@ COST_CATEGORIES = {
     '기타': ['해지미정산', '기타1', '제경비', '카드매출수수료', '관기타2', '캠퍼스기타2']
 }
 
+# 표시 단위 옵션 (rerun마다 dict를 새로 만들지 않도록 모듈 상수로 유지)
+UNIT_OPTIONS = {
+    "원 (W)": (1, " 원"),
+    "천 원 (K)": (1000, " 천 원"),
+    "백만 원 (M)": (1000000, " 백만 원"),
+    "천만 원 (10M)": (10000000, " 천만 원"),
+    "억 원 (B)": (100000000, " 억 원")
+}
+UNIT_LABELS = list(UNIT_OPTIONS)
+
 # 통화 형식 지정 함수 (선택된 단위로 나누고 포맷팅)
-def format_currency(value, unit_str=" 원", divisor=1):
-    if pd.isna(value) or value is None:
-        return f"0{unit_str}"
-    
+@functools.lru_cache(maxsize=4096)
+def _format_currency_cached(value, unit_str, divisor):
     display_value = value / divisor
-    
+
     if divisor == 1:
         # '원' 단위는 정수로 표시
         return f"{int(value):,d}{unit_str}"
     else:
         # '천 원' 이상 단위는 소수점 첫째 자리까지 표시
         return f"{display_value:,.1f}{unit_str}"
+
+
+def format_currency(value, unit_str=" 원", divisor=1):
+    if value is None or pd.isna(value):
+        return f"0{unit_str}"
+    # 메트릭 카드/테이블 렌더링에서 같은 값이 반복 포맷되므로 결과를 캐시
+    # (소수 2자리로 양자화해 캐시 키 개수를 제한)
+    return _format_currency_cached(round(float(value), 2), unit_str, divisor)
         
-# 분기 계산 함수
-def get_quarter(month_str):
-    month = int(month_str)
-    if 1 <= month <= 3: return 'Q1'
-    if 4 <= month <= 6: return 'Q2'
-    if 7 <= month <= 9: return 'Q3'
-    if 10 <= month <= 12: return 'Q4'
-    return 'N/A'
+# 월(1~12) → 분기 라벨 LUT (인덱스 0은 비정상 월 방어용)
+_MONTH_TO_QUARTER = np.array(
+    ['N/A', 'Q1', 'Q1', 'Q1', 'Q2', 'Q2', 'Q2', 'Q3', 'Q3', 'Q3', 'Q4', 'Q4', 'Q4']
+)
+
+# 포맷터는 모듈 수준에 한 번만 바인딩 (셀마다 포맷 문자열/메서드를 새로 해석하지 않음)
+_FMT_INT = '{:,d}'.format
+_FMT_1F = '{:,.1f}'.format
+
+
+# 통화/증감률 컬럼 일괄 포맷 함수 (셀 단위 apply(lambda) 대신 블록 단위로 한 번에 처리)
+def _format_currency_values(vals, unit_str, divisor):
+    if divisor == 1:
+        # '원' 단위는 정수로 표시
+        flat = np.fromiter(
+            (_FMT_INT(v) for v in vals.astype(np.int64).ravel()),
+            dtype=object, count=vals.size,
+        )
+    else:
+        # '천 원' 이상 단위는 소수점 첫째 자리까지 표시
+        flat = np.fromiter(
+            (_FMT_1F(v) for v in (vals / divisor).ravel()),
+            dtype=object, count=vals.size,
+        )
+    return (flat + unit_str).reshape(vals.shape)
+
+
+def format_currency_series(ser, unit_str=" 원", divisor=1):
+    vals = pd.to_numeric(ser, errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    return pd.Series(_format_currency_values(vals, unit_str, divisor), index=ser.index)
+
+
+def format_currency_array(arr, unit_str=" 원", divisor=1):
+    """숫자 배열(그래프 라벨 등)을 통화 문자열 배열로 한 번에 변환합니다."""
+    vals = np.nan_to_num(np.asarray(arr, dtype=np.float64))
+    return _format_currency_values(vals, unit_str, divisor)
+
+
+def format_currency_block(df_block, unit_str=" 원", divisor=1):
+    """통화 컬럼 여러 개를 2차원 배열 한 번의 패스로 포맷합니다."""
+    vals = df_block.apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+    return pd.DataFrame(
+        _format_currency_values(vals, unit_str, divisor),
+        index=df_block.index, columns=df_block.columns,
+    )
+
+
+def format_rate_series(ser):
+    arr = pd.to_numeric(ser, errors='coerce').to_numpy(dtype=np.float64)
+    # NaN/+Inf는 numpy 마스크 한 번으로 분류하고, 포맷은 유효 구간에만 적용
+    valid = ~(np.isnan(arr) | (arr == np.inf))
+    out = np.full(arr.shape, 'Inf %', dtype=object)
+    vals = np.round(arr[valid], 1)
+    if vals.size and (np.abs(vals) < 1000).all():
+        # 천 단위 구분이 필요 없으면 round→astype(str) C 경로로 일괄 변환
+        out[valid] = (pd.Series(vals).astype(str) + ' %').to_numpy()
+    else:
+        out[valid] = [_FMT_1F(v) + ' %' for v in vals]
+    return pd.Series(out, index=ser.index)
+
+
+# 핵심 지표 카드 HTML 템플릿 함수 (세 카드가 같은 마크업을 공유)
+def _metric_card(title, value_str, delta_html):
+    return f"""
+    <div style="background: white; border-radius: 16px; padding: 1.75rem 1.5rem;
+                box-shadow: 0 1px 3px 0 rgba(0, 0, 0, 0.1); border-left: 4px solid #3b82f6;">
+        <div style="font-size: 0.875rem; font-weight: 600; color: #64748b;
+                    text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.5rem;">
+            {title}
+        </div>
+        <div style="font-size: 2rem; font-weight: 700; color: #0f172a; margin-bottom: 0.5rem;">
+            {value_str}
+        </div>
+        <div>
+            {delta_html}
+        </div>
+    </div>
+    """
+
+
+# 핵심 지표 증감 배지 HTML 함수 (색상/기호 결정을 NumPy로 일괄 처리 — 행 단위 확장 대비)
+def _delta_badges(deltas, bases, display_unit, display_divisor, invert_color):
+    deltas = np.asarray(deltas, dtype=np.float64)
+    bases = np.asarray(bases, dtype=np.float64)
+    invert_color = np.asarray(invert_color, dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(bases != 0, deltas / bases * 100, 0.0)
+    positive = deltas >= 0
+    # 비용처럼 증가가 나쁜 지표는 invert_color=True로 색상 반전
+    colors = np.where(positive ^ invert_color, '#2563eb', '#ef4444')
+    symbols = np.where(positive, '+', '△')
+    scaled = np.abs(deltas / display_divisor)
+    abs_rates = np.abs(rates)
+    return np.array([
+        f'<span style="color: {color}; font-weight: 600; font-size: 0.95rem;">'
+        f'{symbol}{value:.1f}{display_unit} ({symbol}{rate:.1f}%)</span>'
+        for color, symbol, value, rate in zip(colors, symbols, scaled, abs_rates)
+    ], dtype=object)
+
+
+# 증감률(%) 계산 함수 (분모 0이면 대상값이 0일 때 0, 아니면 inf)
+def safe_pct(delta, base, target):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.asarray(delta, dtype=np.float64) / np.asarray(base, dtype=np.float64) * 100
+    base_zero = np.asarray(base, dtype=np.float64) == 0
+    return np.where(base_zero, np.where(np.asarray(target, dtype=np.float64) == 0, 0, np.inf), rate)
+
 
 # --- 엑셀 다운로드 함수 ---
 def create_excel_report(df_summary, df_trend, df_cost_analysis=None):
     """
     분석 결과를 엑셀 파일로 생성
+
+    시트별 병렬 쓰기는 xlsx 컨테이너(workbook.xml/styles/sharedStrings)가
+    시트 간에 공유되어 안전하지 않으므로, 쓸 시트를 먼저 추려 순차 기록합니다.
     """
-    output = BytesIO()
-    
-    try:
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # 시트 1: 상세 손익 내역
-            if df_summary is not None and not df_summary.empty:
-                df_summary.to_excel(writer, sheet_name='상세손익내역', index=False)
-            
-            # 시트 2: 기간별 추이
-            if df_trend is not None and not df_trend.empty:
-                df_trend.to_excel(writer, sheet_name='기간별추이', index=False)
-            
-            # 시트 3: 비용 분석 (있을 경우)
-            if df_cost_analysis is not None and not df_cost_analysis.empty:
-                df_cost_analysis.to_excel(writer, sheet_name='비용항목분석', index=False)
-    except Exception as e:
-        st.error(f"엑셀 파일 생성 중 오류: {e}")
+    # 빈 시트는 writer를 열기 전에 걸러냄 (전부 비면 워크북 생성 자체를 생략)
+    sheets = [
+        (name, df) for name, df in [
+            ('상세손익내역', df_summary),
+            ('기간별추이', df_trend),
+            ('비용항목분석', df_cost_analysis),
+        ] if df is not None and not df.empty
+    ]
+    if not sheets:
         return None
-    
+
+    output = BytesIO()
+
+    # xlsxwriter: 스타일 없는 대량 쓰기에서는 openpyxl보다 수 배 빠름
+    # (constant_memory는 사용 금지: pandas가 셀을 열 우선으로 쓰기 때문에
+    #  이미 플러시된 행에 대한 쓰기가 조용히 유실됨)
+    # 오류는 여기서 삼키지 않고 그대로 전파: 워커 스레드에는 ScriptRunContext가
+    # 없어 st.error가 표시되지 않으므로, 호출부(메인 스레드)의 st.error가 처리
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        for sheet_name, df_sheet in sheets:
+            df_sheet.to_excel(writer, sheet_name=sheet_name, index=False)
+
     output.seek(0)
     return output
 
-# --- HTML 리포트 생성 함수 ---
-def create_html_report(
-    total_revenue_target, total_cost_target, operating_profit_target,
-    total_revenue_comp, total_cost_comp, operating_profit_comp,
-    delta_revenue, delta_cost, delta_profit,
-    target_label, comparison_year, display_unit, display_divisor,
-    df_summary, df_trend, insights
-):
+# --- HTML 테이블 생성 헬퍼 ---
+def df_to_html_table(df):
     """
-    이메일 첨부용 HTML 리포트 생성
+    DataFrame을 HTML 테이블 문자열로 변환
+    to_html 대비 셀 단위 파이썬 포맷 호출을 줄이기 위해 숫자 컬럼을 먼저 일괄 포맷하고
+    행 단위 join으로 버퍼에 직접 기록합니다.
     """
-    
-    # 증감률 계산
-    revenue_rate = (delta_revenue / total_revenue_comp * 100) if total_revenue_comp != 0 else 0
-    cost_rate = (delta_cost / total_cost_comp * 100) if total_cost_comp != 0 else 0
-    profit_rate = (delta_profit / operating_profit_comp * 100) if operating_profit_comp != 0 else 0
-    
-    # 색상 결정
-    profit_color = "#2563eb" if delta_profit >= 0 else "#ef4444"
-    revenue_color = "#2563eb" if delta_revenue >= 0 else "#ef4444"
-    cost_color = "#ef4444" if delta_cost >= 0 else "#2563eb"
-    
-    profit_symbol = "+" if delta_profit >= 0 else "△"
-    revenue_symbol = "+" if delta_revenue >= 0 else "△"
-    cost_symbol = "+" if delta_cost >= 0 else "△"
-    
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>손익 분석 리포트</title>
+    df_fmt = df.copy()
+    for col in df_fmt.select_dtypes(include=np.number).columns:
+        df_fmt[col] = df_fmt[col].map('{:,.1f}'.format)
+
+    buf = StringIO()
+    buf.write('<table class="data-table"><thead><tr>')
+    buf.write(''.join(f'<th>{c}</th>' for c in df_fmt.columns))
+    buf.write('</tr></thead><tbody>')
+    buf.write(''.join(
+        '<tr>' + ''.join(f'<td>{v}</td>' for v in row) + '</tr>'
+        for row in df_fmt.itertuples(index=False, name=None)
+    ))
+    buf.write('</tbody></table>')
+    return buf.getvalue()
+
+
+# 이메일 리포트용 CSS — 상수 블록이므로 매 호출마다 f-string 파서를 거치지 않도록
+# 모듈 레벨 일반 문자열로 보관합니다.
+_REPORT_CSS = """
         <style>
-            body {{
+            body {
                 font-family: 'Segoe UI', -apple-system, BlinkMacSystemFont, sans-serif;
                 margin: 0;
                 padding: 20px;
                 background-color: #f8fafc;
-            }}
-            .container {{
+            }
+            .container {
                 max-width: 1200px;
                 margin: 0 auto;
                 background: white;
                 padding: 40px;
                 border-radius: 12px;
                 box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-            }}
-            h1 {{
+            }
+            h1 {
                 color: #1e40af;
                 border-bottom: 3px solid #3b82f6;
                 padding-bottom: 10px;
                 margin-bottom: 30px;
-            }}
-            h2 {{
+            }
+            h2 {
                 color: #334155;
                 margin-top: 30px;
                 margin-bottom: 15px;
-            }}
-            .metrics {{
+            }
+            .metrics {
                 display: grid;
                 grid-template-columns: repeat(3, 1fr);
                 gap: 20px;
                 margin-bottom: 40px;
-            }}
-            .metric-card {{
+            }
+            .metric-card {
                 background: white;
                 border: 1px solid #e2e8f0;
                 border-left: 4px solid #3b82f6;
                 border-radius: 12px;
                 padding: 20px;
                 box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-            }}
-            .metric-label {{
+            }
+            .metric-label {
                 font-size: 0.875rem;
                 color: #64748b;
                 text-transform: uppercase;
                 letter-spacing: 0.05em;
                 margin-bottom: 8px;
-            }}
-            .metric-value {{
+            }
+            .metric-value {
                 font-size: 2rem;
                 font-weight: 700;
                 color: #0f172a;
                 margin-bottom: 8px;
-            }}
-            .metric-delta {{
+            }
+            .metric-delta {
                 font-size: 0.95rem;
                 font-weight: 600;
-            }}
-            table {{
+            }
+            table {
                 width: 100%;
                 border-collapse: collapse;
                 margin-top: 20px;
                 font-size: 0.9rem;
-            }}
-            th {{
+            }
+            th {
                 background: linear-gradient(135deg, #1e40af 0%, #3b82f6 100%);
                 color: white;
                 padding: 12px;
                 text-align: left;
                 font-weight: 600;
-            }}
-            td {{
+            }
+            td {
                 padding: 10px 12px;
                 border-bottom: 1px solid #e2e8f0;
-            }}
-            tr:nth-child(even) {{
+            }
+            tr:nth-child(even) {
                 background-color: #f8fafc;
-            }}
-            .insight-box {{
+            }
+            .insight-box {
                 background: #f0f9ff;
                 border-left: 4px solid #3b82f6;
                 padding: 15px;
                 margin: 10px 0;
                 border-radius: 8px;
-            }}
-            .insight-positive {{ border-left-color: #10b981; background: #ecfdf5; }}
-            .insight-negative {{ border-left-color: #ef4444; background: #fef2f2; }}
-            .footer {{
+            }
+            .insight-positive { border-left-color: #10b981; background: #ecfdf5; }
+            .insight-negative { border-left-color: #ef4444; background: #fef2f2; }
+            .footer {
                 margin-top: 40px;
                 padding-top: 20px;
                 border-top: 2px solid #e2e8f0;
                 text-align: center;
                 color: #64748b;
                 font-size: 0.875rem;
-            }}
+            }
         </style>
+"""
+
+
+# --- HTML 리포트 생성 함수 ---
+def create_html_report(
+    total_revenue_target, total_cost_target, operating_profit_target,
+    total_revenue_comp, total_cost_comp, operating_profit_comp,
+    delta_revenue, delta_cost, delta_profit,
+    target_label, comparison_year, display_unit, display_divisor,
+    df_summary, df_trend, insights
+):
+    """
+    이메일 첨부용 HTML 리포트 생성
+    """
+    
+    # 증감률 계산
+    revenue_rate = (delta_revenue / total_revenue_comp * 100) if total_revenue_comp != 0 else 0
+    cost_rate = (delta_cost / total_cost_comp * 100) if total_cost_comp != 0 else 0
+    profit_rate = (delta_profit / operating_profit_comp * 100) if operating_profit_comp != 0 else 0
+    
+    # 색상 결정
+    profit_color = "#2563eb" if delta_profit >= 0 else "#ef4444"
+    revenue_color = "#2563eb" if delta_revenue >= 0 else "#ef4444"
+    cost_color = "#ef4444" if delta_cost >= 0 else "#2563eb"
+    
+    profit_symbol = "+" if delta_profit >= 0 else "△"
+    revenue_symbol = "+" if delta_revenue >= 0 else "△"
+    cost_symbol = "+" if delta_cost >= 0 else "△"
+    
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>손익 분석 리포트</title>
+""" + _REPORT_CSS + f"""
+
     </head>
     <body>
         <div class="container">
@@ -293,12 +455,12 @@ def create_html_report(
     # 상세 손익 내역 테이블 추가
     if df_summary is not None and not df_summary.empty:
         html_content += "<h2>📊 상세 손익 내역</h2>"
-        html_content += df_summary.to_html(index=False, escape=False, classes='data-table')
+        html_content += df_to_html_table(df_summary)
     
     # 기간별 추이 테이블 추가
     if df_trend is not None and not df_trend.empty:
         html_content += "<h2>📋 기간별 손익 추이</h2>"
-        html_content += df_trend.to_html(index=False, escape=False, classes='data-table')
+        html_content += df_to_html_table(df_trend)
     
     html_content += """
             <div class="footer">
@@ -312,11 +474,21 @@ def create_html_report(
     return html_content
 
 # --- 2. 데이터 로드 및 전처리 캐시 함수 ---
-@st.cache_data(show_spinner="엑셀 데이터를 로드하고 분석을 위해 전처리 중입니다...")
 def load_data(file):
+    # UploadedFile 객체는 rerun마다 identity가 바뀌므로 내용 해시를 캐시 키로 사용
+    file_bytes = file.getvalue()
+    file_hash = hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+    return load_data_cached(file_hash, file_bytes)
+
+
+@st.cache_data(show_spinner="엑셀 데이터를 로드하고 분석을 위해 전처리 중입니다...")
+def load_data_cached(file_hash, _file_bytes):
     try:
         # 파일 읽기 및 기본 전처리
-        df_loaded = pd.read_excel(file)
+        # calamine 엔진: openpyxl 대비 xlsx 파싱이 수 배 빠름
+        # dtype_backend='pyarrow': 문자열이 object 배열 대신 Arrow 버퍼로 들어와
+        # 메모리를 크게 줄이고 이후 변환(카테고리/숫자화) 전의 중간 상태도 가벼움
+        df_loaded = pd.read_excel(BytesIO(_file_bytes), engine='calamine', dtype_backend='pyarrow')
         
         # '년월' 컬럼 전처리
         if '년월' not in df_loaded.columns:
@@ -324,11 +496,19 @@ def load_data(file):
              return None
              
         df_loaded['년월'] = df_loaded['년월'].astype(str)
-        df_loaded['년'] = df_loaded['년월'].str[:4]
-        df_loaded['월'] = df_loaded['년월'].str[4:6]
-        df_loaded['분기'] = df_loaded['월'].apply(get_quarter)
-        df_loaded['년분기'] = df_loaded['년'] + ' ' + df_loaded['분기']
-        df_loaded['sort_key'] = df_loaded['년월'].astype(int) 
+        # '년월'을 정수로 한 번만 변환해 년/월/정렬키를 산술 연산으로 도출 (.str 슬라이싱 3회 제거)
+        ym = df_loaded['년월'].astype(np.int64).to_numpy()
+        month_no = (ym % 100).astype(np.int8)
+        df_loaded['년'] = (ym // 100).astype(str)
+        df_loaded['월'] = np.char.zfill(month_no.astype(str), 2)
+        # 추이 테이블/그래프 표시용 월 라벨(앞자리 0 제거)도 로드 시 한 번만 계산
+        df_loaded['월_display'] = month_no.astype(str)
+        # 분기 계산: 13-엔트리 LUT 팬시 인덱싱 한 번으로 처리 (산술/문자열 결합도 제거)
+        valid_month = (month_no >= 1) & (month_no <= 12)
+        df_loaded['분기'] = _MONTH_TO_QUARTER[np.where(valid_month, month_no, 0)]
+        # '년분기' 라벨은 aggregate_profit_trend의 분기 분석 경로에서만 필요하므로
+        # 행 단위 문자열 컬럼으로 만들지 않고 해당 함수에서 필요할 때 계산합니다.
+        df_loaded['sort_key'] = ym
         
         # 필터 컬럼 전처리
         FILTER_COLUMNS = ['수익코드', '캠퍼스', '브랜드', '사업부']
@@ -338,6 +518,11 @@ def load_data(file):
                 return None
             df_loaded[col] = df_loaded[col].fillna('N/A').astype(str)
 
+        # 필터/기간 컬럼은 category dtype으로 저장
+        # (object 문자열 대비 메모리 ~10x 절감, groupby/isin이 정수 코드로 동작)
+        for col in FILTER_COLUMNS + ['년', '월', '월_display', '분기']:
+            df_loaded[col] = df_loaded[col].astype('category')
+
         # 재무 컬럼 계산
         if '매출액' not in df_loaded.columns:
              st.error("필수 재무 컬럼인 '매출액'이 누락되었습니다.")
@@ -348,11 +533,20 @@ def load_data(file):
         # 비용 컬럼 존재 확인 및 계산
         all_costs_present = all(col in df_loaded.columns for col in COST_COLUMNS)
         if all_costs_present:
-            for col in COST_COLUMNS:
-                df_loaded[col] = pd.to_numeric(df_loaded[col], errors='coerce').fillna(0)
-                
-            df_loaded['총비용'] = df_loaded[COST_COLUMNS].sum(axis=1)
-            df_loaded['영업이익'] = df_loaded['매출액'] - df_loaded['총비용']
+            # 비용 컬럼 49개를 개별 변환하는 대신 블록 단위로 한 번에 변환 (float32로 메모리 절감)
+            df_loaded[COST_COLUMNS] = (
+                df_loaded[COST_COLUMNS]
+                .apply(pd.to_numeric, errors='coerce')
+                .fillna(0)
+                .astype(np.float32)
+            )
+            # 총비용/영업이익은 비용 블록을 NumPy 배열로 한 번만 읽어 계산 (중간 Series 생성 방지)
+            cost_arr = np.ascontiguousarray(
+                df_loaded[COST_COLUMNS].to_numpy(dtype=np.float32, copy=False)
+            )
+            total_cost = cost_arr.sum(axis=1)
+            df_loaded['총비용'] = total_cost
+            df_loaded['영업이익'] = df_loaded['매출액'].to_numpy() - total_cost
         else:
             # 비용 컬럼이 없으면 영업이익 = 매출액으로 임시 계산
             df_loaded['총비용'] = 0
@@ -366,27 +560,35 @@ def load_data(file):
         return None
 
 # 데이터 집계 함수 (display_label 추가)
+# 같은 rerun 안에서 테이블/그래프가 동일 입력으로 여러 번 호출하므로 캐시
+@st.cache_data(show_spinner=False)
 def aggregate_profit_trend(df_input, time_col, sort_col, is_cumulative, period_label):
     if df_input.empty:
         return None
     
     if time_col == '년분기':
-        df_input['time_label'] = df_input['년'] + ' ' + df_input['분기']
-        df_agg = df_input.groupby('time_label').agg(
+        # 입력 프레임을 변경하지 않도록 라벨은 별도 Series로 생성
+        time_label = (df_input['년'].astype(str) + ' ' + df_input['분기'].astype(str)).rename('time_label')
+        df_agg = df_input.groupby(time_label).agg(
             {'영업이익': 'sum', '매출액': 'sum', sort_col: 'min'}
         ).reset_index().rename(columns={'time_label': time_col})
         df_agg = df_agg.sort_values(sort_col)
         df_agg['display_label'] = df_agg[time_col] # Ex: 2024 Q1
     else: # 월별
-        df_agg = df_input.groupby([time_col, sort_col])[['영업이익', '매출액']].sum().reset_index().sort_values(sort_col)
-        # '월' 부분을 추출하고, 앞의 0을 제거하여 표시합니다.
-        df_agg['display_label'] = df_agg[time_col].str[4:6].str.lstrip('0')
+        # 로드 시 계산해 둔 '월_display'를 그대로 사용 (호출마다 문자열 슬라이싱/lstrip 불필요)
+        df_agg = (
+            df_input.groupby([time_col, sort_col], observed=True)
+            .agg({'영업이익': 'sum', '매출액': 'sum', '월_display': 'first'})
+            .reset_index()
+            .sort_values(sort_col)
+            .rename(columns={'월_display': 'display_label'})
+        )
 
     if is_cumulative:
-        df_agg['누적 영업이익'] = df_agg['영업이익'].cumsum()
-        df_agg['누적 매출액'] = df_agg['매출액'].cumsum()
-        df_agg.drop(columns=['영업이익', '매출액'], inplace=True)
-        df_agg.rename(columns={'누적 영업이익': '영업이익', '누적 매출액': '매출액'}, inplace=True)
+        # 누적 합계는 같은 컬럼에 제자리 갱신 (drop/rename으로 컬럼 인덱스를 두 번 재구성할 필요 없음)
+        # 집계 후 프레임은 이미 기간순 정렬이므로 numpy 스캔 한 번이면 충분
+        df_agg['영업이익'] = np.cumsum(df_agg['영업이익'].to_numpy())
+        df_agg['매출액'] = np.cumsum(df_agg['매출액'].to_numpy())
     
     df_agg['기간'] = period_label
     # time_col과 sort_col은 드롭하고 display_label은 유지
@@ -395,50 +597,32 @@ def aggregate_profit_trend(df_input, time_col, sort_col, is_cumulative, period_l
 
 
 # --- NEW: 비용 항목별 분석 함수 ---
-def analyze_cost_breakdown(df_target, df_comparison, cost_columns, display_divisor, display_unit):
-    """비용 항목별 증감 분석"""
-    
-    # 주요기간 비용 합계
-    target_costs = {}
-    for col in cost_columns:
-        if col in df_target.columns:
-            target_costs[col] = df_target[col].sum()
-        else:
-            target_costs[col] = 0
-    
-    # 비교기간 비용 합계
-    comp_costs = {}
+def analyze_cost_breakdown(df_target, df_comparison, cost_columns):
+    """비용 항목별 증감 분석 (raw 값 — 표시 단위 포맷은 호출부에서 적용)"""
+
+    # 주요/비교기간 비용 합계를 컬럼 블록 단위로 한 번에 계산 (reindex로 누락 컬럼은 0 처리)
+    target_vals = df_target.reindex(columns=cost_columns).sum(axis=0).to_numpy(dtype=np.float64)
+
     if df_comparison is not None and not df_comparison.empty:
-        for col in cost_columns:
-            if col in df_comparison.columns:
-                comp_costs[col] = df_comparison[col].sum()
-            else:
-                comp_costs[col] = 0
+        comp_vals = df_comparison.reindex(columns=cost_columns).sum(axis=0).to_numpy(dtype=np.float64)
     else:
-        for col in cost_columns:
-            comp_costs[col] = 0
-    
-    # 증감 계산
-    result = []
-    for col in cost_columns:
-        target_val = target_costs.get(col, 0)
-        comp_val = comp_costs.get(col, 0)
-        diff = target_val - comp_val
-        
-        if comp_val != 0:
-            diff_rate = (diff / comp_val) * 100
-        else:
-            diff_rate = 0 if target_val == 0 else np.inf
-            
-        result.append({
-            '비용항목': col,
-            '주요기간': target_val,
-            '비교기간': comp_val,
-            '증감액': diff,
-            '증감률': diff_rate
-        })
-    
-    df_result = pd.DataFrame(result)
+        comp_vals = np.zeros(len(cost_columns))
+
+    # 증감 계산 (벡터화)
+    diff_vals = target_vals - comp_vals
+    diff_rate = np.where(
+        comp_vals != 0,
+        np.divide(diff_vals, comp_vals, out=np.zeros_like(diff_vals), where=comp_vals != 0) * 100,
+        np.where(target_vals == 0, 0.0, np.inf)
+    )
+
+    df_result = pd.DataFrame({
+        '비용항목': list(cost_columns),
+        '주요기간': target_vals,
+        '비교기간': comp_vals,
+        '증감액': diff_vals,
+        '증감률': diff_rate
+    })
     return df_result
 
 
@@ -493,11 +677,14 @@ def generate_ai_insights(df_target, df_comparison, cost_columns, cost_categories
                 'content': f"영업이익이 전기 대비 {abs(profit_rate):.1f}% 감소했습니다. 비용 구조 점검이 필요합니다."
             })
         
-        # 2. 카테고리별 비용 분석
+        # 2. 카테고리별 비용 분석 (컬럼 합계를 한 번만 구하고 카테고리별로는 조회만 수행)
+        target_sums = df_target.reindex(columns=cost_columns).sum(axis=0)
+        comp_sums = df_comparison.reindex(columns=cost_columns).sum(axis=0)
+
         category_changes = []
         for category, cols in cost_categories.items():
-            target_sum = sum(df_target[col].sum() for col in cols if col in df_target.columns)
-            comp_sum = sum(df_comparison[col].sum() for col in cols if col in df_comparison.columns)
+            target_sum = target_sums.reindex(cols, fill_value=0).sum()
+            comp_sum = comp_sums.reindex(cols, fill_value=0).sum()
             diff = target_sum - comp_sum
             rate = (diff / comp_sum * 100) if comp_sum != 0 else 0
             category_changes.append({
@@ -530,11 +717,12 @@ def generate_ai_insights(df_target, df_comparison, cost_columns, cost_categories
             })
         
         # 3. 개별 비용 항목 중 급증/급감 항목
-        cost_analysis = analyze_cost_breakdown(df_target, df_comparison, cost_columns, display_divisor, display_unit)
-        
-        # 증가율 Top 3 (비교기간 금액이 일정 이상인 항목만)
-        significant_costs = cost_analysis[cost_analysis['비교기간'] > 1000000]  # 100만원 이상
-        if not significant_costs.empty:
+        # 비교기간 100만원 초과 항목이 아예 없으면 결과가 비므로 분석 자체를 건너뜀
+        if (comp_sums > 1000000).any():
+            cost_analysis = analyze_cost_breakdown(df_target, df_comparison, cost_columns)
+
+            # 증가율 Top 3 (비교기간 금액이 일정 이상인 항목만)
+            significant_costs = cost_analysis[cost_analysis['비교기간'] > 1000000]  # 100만원 이상
             top_increase_items = significant_costs.nlargest(3, '증감률')
             for _, row in top_increase_items.iterrows():
                 if row['증감률'] > 20:  # 20% 이상 증가
@@ -575,7 +763,8 @@ def create_heatmap(df, grouping_column, value_column, display_divisor, display_u
         index=grouping_column,
         columns='월',
         aggfunc='sum',
-        fill_value=0
+        fill_value=0,
+        observed=True
     )
     
     # 월 순서 정렬
@@ -589,16 +778,17 @@ def create_heatmap(df, grouping_column, value_column, display_divisor, display_u
     # 단위 적용
     pivot_df_scaled = pivot_df / display_divisor
     
-    # 히트맵 생성
-    fig = go.Figure(data=go.Heatmap(
-        z=pivot_df_scaled.values,
-        x=pivot_df_scaled.columns,
-        y=pivot_df_scaled.index,
-        colorscale='Blues',
-        hoverongaps=False,
+    # 히트맵 생성 (px.imshow: go.Heatmap 대비 payload가 가볍고, 셀 수가 적을 때만 값 라벨 표시)
+    fig = px.imshow(
+        pivot_df_scaled,
+        color_continuous_scale='Blues',
+        aspect='auto',
+        text_auto='.1f' if len(pivot_df_scaled) < 30 else False
+    )
+    fig.update_traces(
         hovertemplate=f'%{{y}}<br>%{{x}}: %{{z:,.1f}}{display_unit}<extra></extra>'
-    ))
-    
+    )
+
     fig.update_layout(
         title=f'{grouping_column}별 × 월별 {value_column} 히트맵',
         xaxis_title='월',
@@ -609,6 +799,137 @@ def create_heatmap(df, grouping_column, value_column, display_divisor, display_u
     return fig, pivot_df_scaled
 
 
+# --- NEW: 사이드바 필터 선택지 헬퍼 ---
+@st.cache_data(show_spinner=False)
+def get_filter_options(df, col):
+    """컬럼별 정렬된 고유값 목록 (위젯 rerun마다 unique/sort를 반복하지 않도록 캐시)"""
+    ser = df[col]
+    if isinstance(ser.dtype, pd.CategoricalDtype):
+        # load_data에서 category로 변환된 컬럼은 전체 스캔 없이 카테고리 목록을 그대로 사용
+        return sorted(ser.cat.categories.tolist())
+    return sorted(ser.unique().tolist())
+
+
+# --- NEW: 공통 필터링 헬퍼 ---
+@st.cache_resource(show_spinner=False)
+def get_indexed_df(df):
+    """
+    (년, 월) 정렬 MultiIndex 프레임 — 기간 필터를 전체 isin 스캔 대신
+    정렬 인덱스 조회(이진 탐색)로 처리하기 위한 읽기 전용 사본입니다.
+    cache_resource: 매 호출마다 프레임 전체를 복사하지 않도록 (절대 변경 금지)
+    """
+    return df.set_index(['년', '월']).sort_index()
+
+
+def apply_filters(df, years, months, selected_filter_values):
+    """
+    년/월 기간 필터는 정렬 인덱스 조회로, 상세 필터는 불리언 마스크 하나로
+    합쳐 한 번만 인덱싱합니다. (조건별 체이닝 필터링은 단계마다 중간
+    DataFrame을 새로 할당)
+    """
+    df_indexed = get_indexed_df(df)
+    try:
+        subset = df_indexed.loc[(list(years), list(months)), :]
+    except KeyError:
+        # 인덱스에 없는 라벨이 섞여 있으면 isin 마스크 경로로 대체
+        subset = df_indexed[
+            df_indexed.index.get_level_values('년').isin(years)
+            & df_indexed.index.get_level_values('월').isin(months)
+        ]
+    subset = subset.reset_index()
+
+    masks = [
+        subset[col].isin(values).to_numpy()
+        for col, values in selected_filter_values.items() if values
+    ]
+    if masks:
+        subset = subset[np.logical_and.reduce(masks)]
+    return subset
+
+
+# --- NEW: 집계 캐시 헬퍼 ---
+@st.cache_data(show_spinner=False)
+def compute_totals(df, years, months, filter_key):
+    """
+    매출액/총비용/영업이익 합계 (필터 조합별 캐시)
+    표시 단위 변경처럼 집계와 무관한 rerun에서는 재계산하지 않습니다.
+    """
+    df_filtered = apply_filters(df, years, months, dict(filter_key))
+    return df_filtered[['매출액', '총비용', '영업이익']].sum()
+
+
+@st.cache_data(show_spinner=False)
+def compute_breakdown(df, years, months, filter_key, breakdown_cols):
+    """분석 기준별 매출액/영업이익 groupby 합계 (필터 조합별 캐시)"""
+    df_filtered = apply_filters(df, years, months, dict(filter_key))
+    return (
+        df_filtered.groupby(list(breakdown_cols), observed=True)[['매출액', '영업이익']]
+        .sum()
+        .reset_index()
+    )
+
+
+@st.cache_data(show_spinner=False)
+def compute_cost_breakdown(df, years, months, comp_key, filter_key, cost_columns):
+    """비용 항목별 증감 분석 결과 (필터 조합별 캐시, 표시 단위와 무관)"""
+    df_target = apply_filters(df, years, months, dict(filter_key))
+    df_comparison = None
+    if comp_key is not None:
+        comp_years, comp_months = comp_key
+        df_comparison = apply_filters(df, comp_years, comp_months, dict(filter_key))
+    return analyze_cost_breakdown(df_target, df_comparison, list(cost_columns))
+
+
+@st.cache_data(show_spinner=False)
+def compute_insights(df, years, months, comp_key, filter_key,
+                     total_revenue_target, total_revenue_comp,
+                     operating_profit_target, operating_profit_comp,
+                     display_divisor, display_unit):
+    """AI 인사이트 분석 결과 (필터 조합별 캐시)"""
+    df_target = apply_filters(df, years, months, dict(filter_key))
+    df_comparison = None
+    if comp_key is not None:
+        comp_years, comp_months = comp_key
+        df_comparison = apply_filters(df, comp_years, comp_months, dict(filter_key))
+    return generate_ai_insights(
+        df_target, df_comparison, COST_COLUMNS, COST_CATEGORIES,
+        total_revenue_target, total_revenue_comp,
+        operating_profit_target, operating_profit_comp,
+        display_divisor, display_unit,
+    )
+
+
+@st.cache_data(show_spinner=False)
+def compute_heatmap(df, years, months, filter_key, grouping_column, value_column, display_divisor, display_unit):
+    """히트맵 figure/pivot (필터·기준 조합별 캐시)"""
+    df_filtered = apply_filters(df, years, months, dict(filter_key))
+    return create_heatmap(df_filtered, grouping_column, value_column, display_divisor, display_unit)
+
+
+@st.cache_data(show_spinner=False)
+def build_reports(df_summary, df_trend, df_cost_analysis,
+                  total_revenue_target, total_cost_target, operating_profit_target,
+                  total_revenue_comp, total_cost_comp, operating_profit_comp,
+                  delta_revenue, delta_cost, delta_profit,
+                  target_label, comparison_year, display_unit, display_divisor,
+                  insights):
+    """엑셀/HTML 리포트를 스레드 2개로 동시에 생성 (입력이 같으면 캐시 재사용)"""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        fut_excel = executor.submit(create_excel_report, df_summary, df_trend, df_cost_analysis)
+        fut_html = executor.submit(
+            create_html_report,
+            total_revenue_target, total_cost_target, operating_profit_target,
+            total_revenue_comp, total_cost_comp, operating_profit_comp,
+            delta_revenue, delta_cost, delta_profit,
+            target_label, comparison_year, display_unit, display_divisor,
+            df_summary, df_trend, insights,
+        )
+        excel_output = fut_excel.result()
+        html_report = fut_html.result()
+    # BytesIO는 캐시에 피클되지 않으므로 bytes로 반환
+    return (excel_output.getvalue() if excel_output is not None else None, html_report)
+
+
 # --- 3. Session State 및 페이지 전환 로직 ---
 
 # Session State 초기화
@@ -627,67 +948,80 @@ def reset_app():
 # --- 4. 메인 페이지 렌더링 (업로드 또는 분석) ---
 
 # --- Year-Over-Year Quarterly Plotting Function ---
-def plot_quarterly_yoy_revenue(df, target_years, comp_year, selected_months_str, is_cumulative, display_divisor, display_unit):
-    
-    st.markdown(f"### 📈 분기별 매출액 추이 그래프 (Year-Over-Year 비교, 단위: {display_unit})")
-
-    # Filter only relevant months for calculation consistency
-    max_month_str = max(selected_months_str) if selected_months_str else '12'
-    all_months_in_range = sorted([m for m in df['월'].unique().tolist() if m <= max_month_str])
-    
-    # Identify all years to be plotted: Target years + Comparison year (if active)
-    years_to_plot = [y for y in target_years]
-    if comp_year != '선택 안함':
-        years_to_plot.append(comp_year)
-    years_to_plot = sorted(list(set(years_to_plot))) # Ensure unique and sorted
+@st.cache_data(show_spinner=False)
+def aggregate_quarterly_yoy(df, years_to_plot, comp_year, months_in_range, is_cumulative):
+    """
+    연도 × 분기 매출/영업이익 집계 (plot_quarterly_yoy_revenue의 데이터 파트)
+    위젯 조작으로 인한 rerun에서 동일 입력이면 캐시를 재사용합니다.
+    """
+    # 전체 연도를 (년, 분기) groupby 한 번으로 집계 — 연도별 전체 스캔 N회를 제거
+    agg_all = (
+        df[df['년'].isin(years_to_plot) & df['월'].isin(months_in_range)]
+        .groupby(['년', '분기'], observed=True, sort=False)[['영업이익', '매출액']]
+        .sum()
+        .reset_index()
+        .rename(columns={'분기': 'Quarter'})
+    )
 
     yoy_plot_data = []
-    
-    # Quarters order for plotting
-    quarter_order = ['Q1', 'Q2', 'Q3', 'Q4']
 
     for year in years_to_plot:
-        df_year = df[
-            (df['년'] == year) & 
-            df['월'].isin(all_months_in_range)
-        ].copy()
-
-        if not df_year.empty:
-            # Aggregate by Quarter (Group by Quarter only)
-            df_agg = df_year.groupby('분기').agg(
-                {'영업이익': 'sum', '매출액': 'sum'}
-            ).reset_index().rename(columns={'분기': 'Quarter'})
-            
-            # Apply cumulative logic if needed (within the year)
+        # 이미 집계된 소규모 프레임(연도당 최대 4행)에서 슬라이스
+        df_agg = agg_all[agg_all['년'] == year].drop(columns=['년'])
+
+        if not df_agg.empty:
+            # Q1-Q4 순서 보장 (누적 모드는 정렬 후 연도 내 누적 합계 적용)
+            df_agg['Quarter_Sort'] = df_agg['Quarter'].str.replace('Q', '').astype(int)
+            df_agg = df_agg.sort_values('Quarter_Sort')
             if is_cumulative:
-                df_agg['Quarter_Sort'] = df_agg['Quarter'].str.replace('Q', '').astype(int)
-                df_agg = df_agg.sort_values('Quarter_Sort')
                 df_agg['매출액'] = df_agg['매출액'].cumsum()
                 df_agg['영업이익'] = df_agg['영업이익'].cumsum()
-                df_agg.drop(columns=['Quarter_Sort'], inplace=True)
-            else:
-                # Ensure Q1-Q4 order for non-cumulative as well
-                df_agg['Quarter_Sort'] = df_agg['Quarter'].str.replace('Q', '').astype(int)
-                df_agg = df_agg.sort_values('Quarter_Sort')
-                df_agg.drop(columns=['Quarter_Sort'], inplace=True)
-            
+            df_agg.drop(columns=['Quarter_Sort'], inplace=True)
+
             df_agg['Year'] = year
-            df_agg['매출액_Scaled'] = df_agg['매출액'] / display_divisor
-            
+
             # Labeling for comparison
             if year == comp_year:
                  df_agg['Period'] = f'비교기간 ({year}년)'
             else:
                  df_agg['Period'] = f'주요기간 ({year}년)'
-                 
+
             yoy_plot_data.append(df_agg)
 
     if not yoy_plot_data:
+        return None
+    return pd.concat(yoy_plot_data, ignore_index=True)
+
+
+def plot_quarterly_yoy_revenue(df, target_years, comp_year, selected_months_str, is_cumulative, display_divisor, display_unit):
+
+    st.markdown(f"### 📈 분기별 매출액 추이 그래프 (Year-Over-Year 비교, 단위: {display_unit})")
+
+    # Filter only relevant months for calculation consistency
+    max_month_str = max(selected_months_str) if selected_months_str else '12'
+    all_months_in_range = sorted([m for m in df['월'].unique().tolist() if m <= max_month_str])
+
+    # Identify all years to be plotted: Target years + Comparison year (if active)
+    years_to_plot = [y for y in target_years]
+    if comp_year != '선택 안함':
+        years_to_plot.append(comp_year)
+    years_to_plot = sorted(list(set(years_to_plot))) # Ensure unique and sorted
+
+    # Quarters order for plotting
+    quarter_order = ['Q1', 'Q2', 'Q3', 'Q4']
+
+    # 집계는 캐시된 헬퍼에서 수행 (단위 변경 등 표시용 rerun에서는 재계산하지 않음)
+    df_plot_combined = aggregate_quarterly_yoy(
+        df, tuple(years_to_plot), comp_year, tuple(all_months_in_range), is_cumulative
+    )
+
+    if df_plot_combined is None:
         st.warning("분기별 Yo-Y 그래프를 그릴 데이터가 없습니다.")
         return
-        
-    df_plot_combined = pd.concat(yoy_plot_data, ignore_index=True)
-    
+
+    # 단위 스케일링은 표시 단계에서만 적용
+    df_plot_combined['매출액_Scaled'] = df_plot_combined['매출액'] / display_divisor
+
     fig = go.Figure()
     
     # 1. 'Quarter' (Q1, Q2, Q3, Q4)를 X축으로 사용하며, 'Period'에 따라 라인을 분리합니다.
@@ -798,14 +1132,14 @@ else:
         st.sidebar.markdown("---")
         st.sidebar.subheader("🎯 주요 기간 필터")
         
-        all_years = sorted(df['년'].unique().tolist(), reverse=True)
+        all_years = list(reversed(get_filter_options(df, '년')))
         selected_years = st.sidebar.multiselect(
             "년도(Year) 선택:",
             options=all_years,
             default=[]  # 초기값: 선택 안함
         )
         
-        all_months_two_digits = sorted(df['월'].unique().tolist())
+        all_months_two_digits = get_filter_options(df, '월')
         display_months = [m.lstrip('0') for m in all_months_two_digits] 
         
         selected_display_months = st.sidebar.multiselect(
@@ -825,7 +1159,7 @@ else:
         selected_filter_values = {}
         
         if analysis_menu == "수익코드":
-            all_revenue_codes = sorted(df['수익코드'].unique().tolist())
+            all_revenue_codes = get_filter_options(df, '수익코드')
             selected_filter_values['수익코드'] = st.sidebar.multiselect(
                 "수익코드 선택:",
                 options=all_revenue_codes,
@@ -835,7 +1169,7 @@ else:
         
         elif analysis_menu in ["사업부", "브랜드", "캠퍼스"]:
             # 사업부, 브랜드, 캠퍼스 분석 시 3개 필터 모두 제공
-            all_business_units = sorted(df['사업부'].unique().tolist())
+            all_business_units = get_filter_options(df, '사업부')
             selected_filter_values['사업부'] = st.sidebar.multiselect(
                 "사업부 선택:",
                 options=all_business_units,
@@ -843,7 +1177,7 @@ else:
                 key="filter_business_unit"
             )
             
-            all_brands = sorted(df['브랜드'].unique().tolist())
+            all_brands = get_filter_options(df, '브랜드')
             selected_filter_values['브랜드'] = st.sidebar.multiselect(
                 "브랜드 선택:",
                 options=all_brands,
@@ -851,7 +1185,7 @@ else:
                 key="filter_brand"
             )
             
-            all_campuses = sorted(df['캠퍼스'].unique().tolist())
+            all_campuses = get_filter_options(df, '캠퍼스')
             selected_filter_values['캠퍼스'] = st.sidebar.multiselect(
                 "캠퍼스 선택:",
                 options=all_campuses,
@@ -859,6 +1193,11 @@ else:
                 key="filter_campus"
             )
         
+        # multiselect 결과를 set으로 변환 (Series.isin이 해시 집합을 그대로 사용)
+        selected_filter_values = {
+            col: set(values) for col, values in selected_filter_values.items()
+        }
+
         # 6-4. 시간 집계 옵션
         st.sidebar.markdown("---")
         st.sidebar.subheader("📈 시간 추이 분석 옵션")
@@ -874,22 +1213,14 @@ else:
         st.sidebar.markdown("---")
         st.sidebar.subheader("💰 표시 단위 설정")
 
-        unit_options = {
-            "원 (W)": (1, " 원"),
-            "천 원 (K)": (1000, " 천 원"),
-            "백만 원 (M)": (1000000, " 백만 원"),
-            "천만 원 (10M)": (10000000, " 천만 원"),
-            "억 원 (B)": (100000000, " 억 원")
-        }
-
         selected_unit_label = st.sidebar.selectbox(
             "단위 선택:",
-            options=list(unit_options.keys()),
+            options=UNIT_LABELS,
             index=2, # 기본값: 백만 원
             key="display_unit_selector"
         )
 
-        display_divisor, display_unit = unit_options[selected_unit_label]
+        display_divisor, display_unit = UNIT_OPTIONS[selected_unit_label]
 
         # --- 7. 메인 화면 비교 기간 설정 및 데이터 필터링 ---
         
@@ -921,18 +1252,18 @@ else:
 
         # --- 데이터 필터링 로직 ---
 
+        # 집계 캐시 키: 상세 필터 선택값을 해시 가능한 튜플로 고정
+        filter_key = tuple(
+            (col, tuple(sorted(values)))
+            for col, values in selected_filter_values.items() if values
+        )
+        # 비교 기간 캐시 키 (비교 미사용 시 None)
+        comp_key = ((comparison_year,), tuple(comparison_selected_months)) if is_comparison_active else None
+
         # 1. Target Data Filtering (Metrics/Breakdown - 사용자가 선택한 월만 합산)
         df_target = pd.DataFrame()
         if selected_years and selected_months:
-            df_target = df[
-                df['년'].isin(selected_years) & 
-                df['월'].isin(selected_months)
-            ].copy()
-            
-            # 동적 필터 적용
-            for filter_col, filter_values in selected_filter_values.items():
-                if filter_values:  # 선택된 값이 있을 때만
-                    df_target = df_target[df_target[filter_col].isin(filter_values)]
+            df_target = apply_filters(df, selected_years, selected_months, selected_filter_values)
             
         # 2. Trend Data Filtering (Graph/Trend Table - 1월부터 선택된 마지막 월까지 모두 포함)
         df_trend_base = pd.DataFrame()
@@ -940,48 +1271,25 @@ else:
         
         if selected_years and selected_months:
             # 주요 기간: 1월부터 선택된 가장 큰 월까지 포함 (그래프 연속성 유지용)
+            # all_months_two_digits는 이미 정렬돼 있으므로 bisect로 구간만 잘라냄
             max_selected_month_str = max(selected_months)
-            all_months_in_range_target = sorted([m for m in all_months_two_digits if m <= max_selected_month_str])
+            all_months_in_range_target = all_months_two_digits[:bisect.bisect_right(all_months_two_digits, max_selected_month_str)]
 
-            df_trend_base = df[
-                df['년'].isin(selected_years) & 
-                df['월'].isin(all_months_in_range_target)
-            ].copy()
-            
-            # 동적 필터 적용
-            for filter_col, filter_values in selected_filter_values.items():
-                if filter_values:
-                    df_trend_base = df_trend_base[df_trend_base[filter_col].isin(filter_values)]
+            df_trend_base = apply_filters(df, selected_years, all_months_in_range_target, selected_filter_values)
             
             # Comparison Data Filtering: Metrics/Breakdown (사용자가 선택한 월만 합산)
             df_comparison = pd.DataFrame()
             if is_comparison_active and comparison_selected_months:
-                df_comparison = df[
-                    (df['년'] == comparison_year) & 
-                    df['월'].isin(comparison_selected_months)
-                ].copy()
-                
-                # 동적 필터 적용
-                for filter_col, filter_values in selected_filter_values.items():
-                    if filter_values:
-                        df_comparison = df_comparison[df_comparison[filter_col].isin(filter_values)]
+                df_comparison = apply_filters(df, [comparison_year], comparison_selected_months, selected_filter_values)
 
                 # 비교 기간: 1월부터 선택된 가장 큰 월까지 포함 (그래프 연속성 유지용)
                 max_comp_month_str = max(comparison_selected_months)
-                all_months_in_range_comp = sorted([m for m in all_months_two_digits if m <= max_comp_month_str])
-                
-                df_comp_trend_base = df[
-                    (df['년'] == comparison_year) & 
-                    df['월'].isin(all_months_in_range_comp)
-                ].copy()
+                all_months_in_range_comp = all_months_two_digits[:bisect.bisect_right(all_months_two_digits, max_comp_month_str)]
                 
-                # 동적 필터 적용
-                for filter_col, filter_values in selected_filter_values.items():
-                    if filter_values:
-                        df_comp_trend_base = df_comp_trend_base[df_comp_trend_base[filter_col].isin(filter_values)]
+                df_comp_trend_base = apply_filters(df, [comparison_year], all_months_in_range_comp, selected_filter_values)
 
         # 조건부 필터링 및 분석 기준 설정 (current_df는 Metrics/Breakdown에만 사용)
-        current_df = df_target.copy()
+        current_df = df_target  # 이후 읽기 전용으로만 사용되므로 복사 불필요
         grouping_column_map = {
             "수익코드": '수익코드',
             "사업부": '사업부',
@@ -1007,10 +1315,11 @@ else:
             st.warning("선택하신 필터 조건에 해당하는 데이터가 없습니다. 필터를 조정해 보세요.")
         else:
             
-            # 8-1. 주요 지표 요약 (메트릭)
-            total_revenue_target = current_df['매출액'].sum()
-            total_cost_target = current_df['총비용'].sum()
-            operating_profit_target = current_df['영업이익'].sum()
+            # 8-1. 주요 지표 요약 (메트릭) — 필터 조합별 캐시에서 합계 조회
+            totals_target = compute_totals(df, tuple(selected_years), tuple(selected_months), filter_key)
+            total_revenue_target = totals_target['매출액']
+            total_cost_target = totals_target['총비용']
+            operating_profit_target = totals_target['영업이익']
             
             delta_revenue, delta_cost, delta_profit = 0, 0, 0  # 초기값 0으로 설정
             delta_label = ""
@@ -1029,42 +1338,22 @@ else:
             insights = []
             
             if is_comparison_active and not df_comparison.empty:
-                total_revenue_comp = df_comparison['매출액'].sum()
-                total_cost_comp = df_comparison['총비용'].sum()
-                operating_profit_comp = df_comparison['영업이익'].sum()
+                totals_comp = compute_totals(df, (comparison_year,), tuple(comparison_selected_months), filter_key)
+                total_revenue_comp = totals_comp['매출액']
+                total_cost_comp = totals_comp['총비용']
+                operating_profit_comp = totals_comp['영업이익']
                 
                 delta_revenue = total_revenue_target - total_revenue_comp
                 delta_cost = total_cost_target - total_cost_comp
                 delta_profit = operating_profit_target - operating_profit_comp
                 
-                # 증감률 계산
-                profit_rate = (delta_profit / operating_profit_comp * 100) if operating_profit_comp != 0 else 0
-                revenue_rate = (delta_revenue / total_revenue_comp * 100) if total_revenue_comp != 0 else 0
-                cost_rate = (delta_cost / total_cost_comp * 100) if total_cost_comp != 0 else 0
-                
-                # 증감액 스케일링
-                delta_profit_scaled = delta_profit / display_divisor
-                delta_revenue_scaled = delta_revenue / display_divisor
-                delta_cost_scaled = delta_cost / display_divisor
-                
-                # Delta HTML 생성 (색상 포함)
-                # 영업이익
-                profit_color = "#2563eb" if delta_profit >= 0 else "#ef4444"
-                profit_symbol = "+" if delta_profit >= 0 else "△"
-                profit_rate_str = f"{profit_rate:.1f}%" if profit_rate >= 0 else f"{abs(profit_rate):.1f}%"
-                delta_profit_html = f'<span style="color: {profit_color}; font-weight: 600; font-size: 0.95rem;">{profit_symbol}{abs(delta_profit_scaled):.1f}{display_unit} ({profit_symbol}{profit_rate_str})</span>'
-                
-                # 매출액
-                revenue_color = "#2563eb" if delta_revenue >= 0 else "#ef4444"
-                revenue_symbol = "+" if delta_revenue >= 0 else "△"
-                revenue_rate_str = f"{revenue_rate:.1f}%" if revenue_rate >= 0 else f"{abs(revenue_rate):.1f}%"
-                delta_revenue_html = f'<span style="color: {revenue_color}; font-weight: 600; font-size: 0.95rem;">{revenue_symbol}{abs(delta_revenue_scaled):.1f}{display_unit} ({revenue_symbol}{revenue_rate_str})</span>'
-                
-                # 총비용 (비용은 감소가 좋으므로 색상 반대)
-                cost_color = "#ef4444" if delta_cost >= 0 else "#2563eb"
-                cost_symbol = "+" if delta_cost >= 0 else "△"
-                cost_rate_str = f"{cost_rate:.1f}%" if cost_rate >= 0 else f"{abs(cost_rate):.1f}%"
-                delta_cost_html = f'<span style="color: {cost_color}; font-weight: 600; font-size: 0.95rem;">{cost_symbol}{abs(delta_cost_scaled):.1f}{display_unit} ({cost_symbol}{cost_rate_str})</span>'
+                # Delta HTML 생성 (색상 포함, 비용은 감소가 좋으므로 색상 반대)
+                delta_profit_html, delta_revenue_html, delta_cost_html = _delta_badges(
+                    [delta_profit, delta_revenue, delta_cost],
+                    [operating_profit_comp, total_revenue_comp, total_cost_comp],
+                    display_unit, display_divisor,
+                    invert_color=[False, False, True],
+                )
                 
                 comp_months_display = ', '.join([m.lstrip('0') for m in comparison_selected_months])
                 delta_label = f" vs. {comparison_year}년 ({comp_months_display}월)"
@@ -1079,60 +1368,22 @@ else:
             st.markdown(f"### 🔑 핵심 손익 지표 (누적 합계){delta_label}")
             
             col_profit, col_revenue, col_cost = st.columns(3)
-            
-            # 영업 이익 Metric (1순위) - 커스텀 HTML 카드
-            with col_profit:
-                st.markdown(f"""
-                <div style="background: white; border-radius: 16px; padding: 1.75rem 1.5rem; 
-                            box-shadow: 0 1px 3px 0 rgba(0, 0, 0, 0.1); border-left: 4px solid #3b82f6;">
-                    <div style="font-size: 0.875rem; font-weight: 600; color: #64748b; 
-                                text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.5rem;">
-                        영업 이익 ({target_label})
-                    </div>
-                    <div style="font-size: 2rem; font-weight: 700; color: #0f172a; margin-bottom: 0.5rem;">
-                        {format_currency(operating_profit_target, display_unit, display_divisor)}
-                    </div>
-                    <div>
-                        {delta_profit_html}
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            # 매출액 Metric (2순위) - 커스텀 HTML 카드
-            with col_revenue:
-                st.markdown(f"""
-                <div style="background: white; border-radius: 16px; padding: 1.75rem 1.5rem; 
-                            box-shadow: 0 1px 3px 0 rgba(0, 0, 0, 0.1); border-left: 4px solid #3b82f6;">
-                    <div style="font-size: 0.875rem; font-weight: 600; color: #64748b; 
-                                text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.5rem;">
-                        총 매출액 ({target_label})
-                    </div>
-                    <div style="font-size: 2rem; font-weight: 700; color: #0f172a; margin-bottom: 0.5rem;">
-                        {format_currency(total_revenue_target, display_unit, display_divisor)}
-                    </div>
-                    <div>
-                        {delta_revenue_html}
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            # 총 비용 Metric (3순위) - 커스텀 HTML 카드
-            with col_cost:
-                st.markdown(f"""
-                <div style="background: white; border-radius: 16px; padding: 1.75rem 1.5rem; 
-                            box-shadow: 0 1px 3px 0 rgba(0, 0, 0, 0.1); border-left: 4px solid #3b82f6;">
-                    <div style="font-size: 0.875rem; font-weight: 600; color: #64748b; 
-                                text-transform: uppercase; letter-spacing: 0.05em; margin-bottom: 0.5rem;">
-                        총 비용 ({target_label})
-                    </div>
-                    <div style="font-size: 2rem; font-weight: 700; color: #0f172a; margin-bottom: 0.5rem;">
-                        {format_currency(total_cost_target, display_unit, display_divisor)}
-                    </div>
-                    <div>
-                        {delta_cost_html}
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+
+            # 커스텀 HTML 카드 (1순위: 영업이익, 2순위: 매출액, 3순위: 총비용)
+            metric_cards = [
+                (col_profit, '영업 이익', operating_profit_target, delta_profit_html),
+                (col_revenue, '총 매출액', total_revenue_target, delta_revenue_html),
+                (col_cost, '총 비용', total_cost_target, delta_cost_html),
+            ]
+            for card_col, card_title, card_value, card_delta_html in metric_cards:
+                card_col.markdown(
+                    _metric_card(
+                        f"{card_title} ({target_label})",
+                        format_currency(card_value, display_unit, display_divisor),
+                        card_delta_html,
+                    ),
+                    unsafe_allow_html=True,
+                )
 
             st.markdown("---")
             
@@ -1142,17 +1393,11 @@ else:
             st.markdown("### 🤖 AI 인사이트 분석")
             
             with st.expander("AI 분석 결과 보기", expanded=True):
-                insights = generate_ai_insights(
-                    df_target=current_df,
-                    df_comparison=df_comparison if is_comparison_active else None,
-                    cost_columns=COST_COLUMNS,
-                    cost_categories=COST_CATEGORIES,
-                    total_revenue_target=total_revenue_target,
-                    total_revenue_comp=total_revenue_comp,
-                    operating_profit_target=operating_profit_target,
-                    operating_profit_comp=operating_profit_comp,
-                    display_divisor=display_divisor,
-                    display_unit=display_unit
+                insights = compute_insights(
+                    df, tuple(selected_years), tuple(selected_months), comp_key, filter_key,
+                    total_revenue_target, total_revenue_comp,
+                    operating_profit_target, operating_profit_comp,
+                    display_divisor, display_unit,
                 )
                 
                 if insights:
@@ -1179,56 +1424,64 @@ else:
             # --- 8-2. 상세 Breakdown 테이블 (영업이익, 매출액) ---
             st.markdown(f"### 📊 상세 손익 내역 (단위: {selected_unit_label})")
             
-            df_target_group = current_df.groupby(breakdown_cols)[['매출액', '영업이익']].sum().reset_index()
+            df_target_group = compute_breakdown(df, tuple(selected_years), tuple(selected_months), filter_key, tuple(breakdown_cols))
             df_target_group.columns = breakdown_cols + ['매출액', '영업이익'] 
-            df_merged = df_target_group.copy()
+            df_merged = df_target_group  # 캐시에서 복사본으로 반환되므로 추가 복사 불필요
             
             if is_comparison_active and not df_comparison.empty:
-                df_comp_group = df_comparison.groupby(breakdown_cols)[['매출액', '영업이익']].sum().reset_index()
+                df_comp_group = compute_breakdown(df, (comparison_year,), tuple(comparison_selected_months), filter_key, tuple(breakdown_cols))
                 df_comp_group.columns = breakdown_cols + ['비교 매출액', '비교 영업이익']
-                df_merged = pd.merge(df_target_group, df_comp_group, on=breakdown_cols, how='outer').fillna(0)
+                # 양쪽 모두 groupby 결과라 키가 정렬돼 있으므로 해시 조인 대신 인덱스 join으로 정렬
+                df_merged = (
+                    df_target_group.set_index(breakdown_cols)
+                    .join(df_comp_group.set_index(breakdown_cols), how='outer')
+                    .fillna(0)
+                    .reset_index()
+                )
                 
                 df_merged['매출액 증감'] = df_merged['매출액'] - df_merged['비교 매출액']
                 df_merged['영업이익 증감'] = df_merged['영업이익'] - df_merged['비교 영업이익']
                 
-                df_merged['매출액 증감률'] = np.where(df_merged['비교 매출액'] == 0, np.where(df_merged['매출액'] == 0, 0, np.inf), (df_merged['매출액 증감'] / df_merged['비교 매출액']) * 100)
-                df_merged['영업이익 증감률'] = np.where(df_merged['비교 영업이익'] == 0, np.where(df_merged['영업이익'] == 0, 0, np.inf), (df_merged['영업이익 증감'] / df_merged['비교 영업이익']) * 100)
+                df_merged['매출액 증감률'] = safe_pct(df_merged['매출액 증감'], df_merged['비교 매출액'], df_merged['매출액'])
+                df_merged['영업이익 증감률'] = safe_pct(df_merged['영업이익 증감'], df_merged['비교 영업이익'], df_merged['영업이익'])
                 
                 final_cols = breakdown_cols + ['영업이익', '영업이익 증감', '영업이익 증감률', '매출액', '매출액 증감', '매출액 증감률']
-                df_display_raw = df_merged[final_cols].copy()
+                df_display_raw = df_merged[final_cols]
             else:
-                df_display_raw = df_merged.copy()
+                df_display_raw = df_merged
 
 
-            # Grand Total Calculation
-            total_row_data = df_display_raw.select_dtypes(include=np.number).sum().to_dict()
+            # Grand Total Calculation (숫자 컬럼은 이름으로 정해져 있어 dtype 스캔 불필요)
+            numeric_total_cols = [col for col in df_display_raw.columns if '영업이익' in col or '매출액' in col]
+            total_row_data = df_display_raw[numeric_total_cols].sum().to_dict()
             
             if is_comparison_active:
                 total_comp_profit = total_row_data['영업이익'] - total_row_data['영업이익 증감']
                 total_comp_revenue = total_row_data['매출액'] - total_row_data['매출액 증감']
                 
-                total_profit_rate = np.where(total_comp_profit == 0, np.where(total_row_data['영업이익'] == 0, 0, np.inf), (total_row_data['영업이익 증감'] / total_comp_profit) * 100)
-                total_revenue_rate = np.where(total_comp_revenue == 0, np.where(total_row_data['매출액'] == 0, 0, np.inf), (total_row_data['매출액 증감'] / total_comp_revenue) * 100)
+                total_profit_rate = safe_pct(total_row_data['영업이익 증감'], total_comp_profit, total_row_data['영업이익'])
+                total_revenue_rate = safe_pct(total_row_data['매출액 증감'], total_comp_revenue, total_row_data['매출액'])
                 
                 total_row_data['영업이익 증감률'] = total_profit_rate
                 total_row_data['매출액 증감률'] = total_revenue_rate
 
 
-            # 데이터 포맷팅
+            # 데이터 포맷팅 (컬럼 분류는 한 번의 패스로)
             df_display = df_display_raw.copy()
-            currency_cols = [col for col in df_display.columns if '영업이익' in col or '매출액' in col]
-            rate_cols = [col for col in df_display.columns if '증감률' in col]
-            
-            for col in currency_cols:
-                if col in rate_cols: continue
-                df_display[col] = df_display[col].apply(
-                    lambda x: format_currency(x, display_unit, display_divisor)
+            currency_only_cols, rate_cols = [], []
+            for col in df_display.columns:
+                if '증감률' in col:
+                    rate_cols.append(col)
+                elif '영업이익' in col or '매출액' in col:
+                    currency_only_cols.append(col)
+
+            if currency_only_cols:
+                df_display[currency_only_cols] = format_currency_block(
+                    df_display[currency_only_cols], display_unit, display_divisor
                 )
 
             for col in rate_cols:
-                df_display[col] = df_display[col].apply(
-                    lambda x: f"{x:,.1f} %" if not pd.isna(x) and x != np.inf else ('N/A' if x == 0 else 'Inf %')
-                )
+                df_display[col] = format_rate_series(df_display[col])
 
             # 총합계 행 포맷팅 및 추가
             total_display_row = {
@@ -1244,13 +1497,13 @@ else:
                 elif '영업이익' in col or '매출액' in col:
                     total_display_row[col] = format_currency(val, display_unit, display_divisor)
                 
-            df_total = pd.DataFrame([total_display_row])
-            df_display = pd.concat([df_display, df_total], ignore_index=True)
+            # 1행짜리 DataFrame을 만들어 concat(전체 복사)하는 대신 제자리로 한 행 추가
+            df_display.loc[len(df_display)] = [total_display_row.get(col, '') for col in df_display.columns]
 
             st.dataframe(df_display, use_container_width=True)
             
             # 엑셀 다운로드용 데이터 저장 (포맷팅 전 raw 데이터)
-            df_summary_for_export = df_display_raw.copy()
+            df_summary_for_export = df_display_raw
             
             st.markdown("---")
             
@@ -1265,92 +1518,81 @@ else:
             if existing_cost_cols:
                 with st.expander("비용 항목별 증감 분석 보기", expanded=False):
                     
-                    cost_df = analyze_cost_breakdown(
-                        df_target=current_df,
-                        df_comparison=df_comparison if is_comparison_active else None,
-                        cost_columns=existing_cost_cols,
-                        display_divisor=display_divisor,
-                        display_unit=display_unit
-                    )
+                    # 접힌 expander 안이라도 파이썬 코드는 매 rerun 실행되므로, 체크했을 때만 계산
+                    if st.checkbox("비용 항목별 분석 계산", value=False, key="show_cost_breakdown"):
+                        cost_df = compute_cost_breakdown(
+                            df, tuple(selected_years), tuple(selected_months), comp_key, filter_key,
+                            tuple(existing_cost_cols)
+                        )
                     
-                    # Top 5 증가/감소 항목 시각화
-                    col_inc, col_dec = st.columns(2)
+                        # Top 5 증가/감소 항목 시각화
+                        col_inc, col_dec = st.columns(2)
                     
-                    with col_inc:
-                        st.markdown("#### 🔺 비용 증가 Top 5")
-                        top_increase = cost_df.nlargest(5, '증감액')
-                        top_increase_positive = top_increase[top_increase['증감액'] > 0]
+                        with col_inc:
+                            st.markdown("#### 🔺 비용 증가 Top 5")
+                            top_increase = cost_df.nlargest(5, '증감액')
+                            top_increase_positive = top_increase[top_increase['증감액'] > 0]
                         
-                        if not top_increase_positive.empty:
-                            fig_inc = px.bar(
-                                top_increase_positive,
-                                x='증감액',
-                                y='비용항목',
-                                orientation='h',
-                                color_discrete_sequence=['#ef4444']
-                            )
-                            fig_inc.update_layout(
-                                xaxis_title=f"증감액 ({display_unit})",
-                                yaxis_title="",
-                                height=300,
-                                showlegend=False
-                            )
-                            fig_inc.update_traces(
-                                text=[format_currency(x, display_unit, display_divisor) for x in top_increase_positive['증감액']],
-                                textposition='outside'
-                            )
-                            st.plotly_chart(fig_inc, use_container_width=True)
-                        else:
-                            st.info("증가한 비용 항목이 없습니다.")
+                            if not top_increase_positive.empty:
+                                fig_inc = px.bar(
+                                    top_increase_positive,
+                                    x='증감액',
+                                    y='비용항목',
+                                    orientation='h',
+                                    color_discrete_sequence=['#ef4444']
+                                )
+                                fig_inc.update_layout(
+                                    xaxis_title=f"증감액 ({display_unit})",
+                                    yaxis_title="",
+                                    height=300,
+                                    showlegend=False
+                                )
+                                fig_inc.update_traces(
+                                    text=format_currency_array(top_increase_positive['증감액'], display_unit, display_divisor),
+                                    textposition='outside'
+                                )
+                                st.plotly_chart(fig_inc, use_container_width=True)
+                            else:
+                                st.info("증가한 비용 항목이 없습니다.")
                     
-                    with col_dec:
-                        st.markdown("#### 🔻 비용 감소 Top 5")
-                        top_decrease = cost_df.nsmallest(5, '증감액')
-                        top_decrease_negative = top_decrease[top_decrease['증감액'] < 0]
+                        with col_dec:
+                            st.markdown("#### 🔻 비용 감소 Top 5")
+                            top_decrease = cost_df.nsmallest(5, '증감액')
+                            top_decrease_negative = top_decrease[top_decrease['증감액'] < 0]
                         
-                        if not top_decrease_negative.empty:
-                            fig_dec = px.bar(
-                                top_decrease_negative,
-                                x='증감액',
-                                y='비용항목',
-                                orientation='h',
-                                color_discrete_sequence=['#10b981']
-                            )
-                            fig_dec.update_layout(
-                                xaxis_title=f"증감액 ({display_unit})",
-                                yaxis_title="",
-                                height=300,
-                                showlegend=False
-                            )
-                            fig_dec.update_traces(
-                                text=[format_currency(x, display_unit, display_divisor) for x in top_decrease_negative['증감액']],
-                                textposition='outside'
-                            )
-                            st.plotly_chart(fig_dec, use_container_width=True)
-                        else:
-                            st.info("감소한 비용 항목이 없습니다.")
+                            if not top_decrease_negative.empty:
+                                fig_dec = px.bar(
+                                    top_decrease_negative,
+                                    x='증감액',
+                                    y='비용항목',
+                                    orientation='h',
+                                    color_discrete_sequence=['#10b981']
+                                )
+                                fig_dec.update_layout(
+                                    xaxis_title=f"증감액 ({display_unit})",
+                                    yaxis_title="",
+                                    height=300,
+                                    showlegend=False
+                                )
+                                fig_dec.update_traces(
+                                    text=format_currency_array(top_decrease_negative['증감액'], display_unit, display_divisor),
+                                    textposition='outside'
+                                )
+                                st.plotly_chart(fig_dec, use_container_width=True)
+                            else:
+                                st.info("감소한 비용 항목이 없습니다.")
                     
-                    # 전체 비용 항목 테이블
-                    st.markdown("#### 📋 전체 비용 항목 상세")
+                        # 전체 비용 항목 테이블
+                        st.markdown("#### 📋 전체 비용 항목 상세")
                     
-                    # 포맷팅
-                    cost_display = cost_df.copy()
-                    cost_display = cost_display.sort_values('증감액', ascending=False)
+                        # 포맷팅
+                        cost_display = cost_df.sort_values('증감액', ascending=False)
                     
-                    cost_display['주요기간'] = cost_display['주요기간'].apply(
-                        lambda x: format_currency(x, display_unit, display_divisor)
-                    )
-                    cost_display['비교기간'] = cost_display['비교기간'].apply(
-                        lambda x: format_currency(x, display_unit, display_divisor)
-                    )
-                    cost_display['증감액'] = cost_display['증감액'].apply(
-                        lambda x: format_currency(x, display_unit, display_divisor)
-                    )
-                    cost_display['증감률'] = cost_display['증감률'].apply(
-                        lambda x: f"{x:,.1f} %" if not pd.isna(x) and x != np.inf else ('N/A' if x == 0 else 'Inf %')
-                    )
+                        for col in ['주요기간', '비교기간', '증감액']:
+                            cost_display[col] = format_currency_series(cost_display[col], display_unit, display_divisor)
+                        cost_display['증감률'] = format_rate_series(cost_display['증감률'])
                     
-                    st.dataframe(cost_display, use_container_width=True)
+                        st.dataframe(cost_display, use_container_width=True)
             else:
                 st.warning("비용 항목 컬럼이 데이터에 없어 비용 분석을 수행할 수 없습니다.")
             
@@ -1363,47 +1605,47 @@ else:
             
             with st.expander("히트맵 보기", expanded=False):
                 
-                heatmap_col1, heatmap_col2 = st.columns(2)
+                # 체크했을 때만 피벗/figure 계산 (접힌 상태 rerun 비용 제거)
+                if st.checkbox("히트맵 계산", value=False, key="show_heatmap"):
+                    heatmap_col1, heatmap_col2 = st.columns(2)
                 
-                with heatmap_col1:
-                    heatmap_grouping = st.selectbox(
-                        "히트맵 기준 선택:",
-                        options=['캠퍼스', '브랜드', '사업부', '수익코드'],
-                        key="heatmap_grouping"
-                    )
+                    with heatmap_col1:
+                        heatmap_grouping = st.selectbox(
+                            "히트맵 기준 선택:",
+                            options=['캠퍼스', '브랜드', '사업부', '수익코드'],
+                            key="heatmap_grouping"
+                        )
                 
-                with heatmap_col2:
-                    heatmap_value = st.selectbox(
-                        "표시 지표 선택:",
-                        options=['매출액', '영업이익'],
-                        key="heatmap_value"
-                    )
+                    with heatmap_col2:
+                        heatmap_value = st.selectbox(
+                            "표시 지표 선택:",
+                            options=['매출액', '영업이익'],
+                            key="heatmap_value"
+                        )
                 
-                # 히트맵 생성
-                if not current_df.empty:
-                    fig_heatmap, pivot_data = create_heatmap(
-                        df=current_df,
-                        grouping_column=heatmap_grouping,
-                        value_column=heatmap_value,
-                        display_divisor=display_divisor,
-                        display_unit=display_unit
-                    )
+                    # 히트맵 생성
+                    if not current_df.empty:
+                        fig_heatmap, pivot_data = compute_heatmap(
+                            df, tuple(selected_years), tuple(selected_months), filter_key,
+                            grouping_column=heatmap_grouping,
+                            value_column=heatmap_value,
+                            display_divisor=display_divisor,
+                            display_unit=display_unit
+                        )
                     
-                    st.plotly_chart(fig_heatmap, use_container_width=True)
+                        st.plotly_chart(fig_heatmap, use_container_width=True)
                     
-                    # 히트맵 데이터 테이블
-                    st.markdown("#### 📋 히트맵 데이터 (상세)")
+                        # 히트맵 데이터 테이블
+                        st.markdown("#### 📋 히트맵 데이터 (상세)")
                     
-                    # 포맷팅
-                    pivot_display = pivot_data.copy()
-                    for col in pivot_display.columns:
-                        pivot_display[col] = pivot_display[col].apply(
-                            lambda x: f"{x:,.1f}"
-                        )
+                        # 포맷팅
+                        pivot_display = pivot_data.copy()
+                        for col in pivot_display.columns:
+                            pivot_display[col] = pivot_display[col].map(_FMT_1F)
                     
-                    st.dataframe(pivot_display, use_container_width=True)
-                else:
-                    st.warning("히트맵을 생성할 데이터가 없습니다.")
+                        st.dataframe(pivot_display, use_container_width=True)
+                    else:
+                        st.warning("히트맵을 생성할 데이터가 없습니다.")
             
             st.markdown("---")
 
@@ -1428,58 +1670,60 @@ else:
             if df_trend_target is not None:
                 
                 if df_trend_comp is not None:
-                    df_trend_target.rename(columns={'영업이익': '영업이익', '매출액': '매출액'}, inplace=True)
                     df_trend_comp.rename(columns={'영업이익': '비교 영업이익', '매출액': '비교 매출액'}, inplace=True)
                     
-                    df_trend_merged = pd.merge(
-                        df_trend_target.drop(columns=['기간']), 
-                        df_trend_comp.drop(columns=['기간']), 
-                        on='display_label', 
-                        how='outer'
-                    ).fillna(0)
+                    # join 전에 필요한 컬럼만 추려 이동하는 데이터 양을 줄이고, fillna는 제자리 처리
+                    trend_target_idx = df_trend_target.set_index('display_label')[['영업이익', '매출액']]
+                    trend_comp_idx = df_trend_comp.set_index('display_label')[['비교 영업이익', '비교 매출액']]
+                    df_trend_merged = trend_target_idx.join(trend_comp_idx, how='outer')
+                    df_trend_merged.fillna(0, inplace=True)
+                    df_trend_merged = df_trend_merged.reset_index()
                     
                     df_trend_merged['영업이익 증감'] = df_trend_merged['영업이익'] - df_trend_merged['비교 영업이익']
                     df_trend_merged['매출액 증감'] = df_trend_merged['매출액'] - df_trend_merged['비교 매출액']
                     
-                    df_trend_merged['영업이익 증감률'] = np.where(df_trend_merged['비교 영업이익'] == 0, np.where(df_trend_merged['영업이익'] == 0, 0, np.inf), (df_trend_merged['영업이익 증감'] / df_trend_merged['비교 영업이익']) * 100)
-                    df_trend_merged['매출액 증감률'] = np.where(df_trend_merged['비교 매출액'] == 0, np.where(df_trend_merged['매출액'] == 0, 0, np.inf), (df_trend_merged['매출액 증감'] / df_trend_merged['비교 매출액']) * 100)
+                    df_trend_merged['영업이익 증감률'] = safe_pct(df_trend_merged['영업이익 증감'], df_trend_merged['비교 영업이익'], df_trend_merged['영업이익'])
+                    df_trend_merged['매출액 증감률'] = safe_pct(df_trend_merged['매출액 증감'], df_trend_merged['비교 매출액'], df_trend_merged['매출액'])
                     
                     df_trend_raw = df_trend_merged[[
                         'display_label', 
                         '영업이익', '영업이익 증감', '영업이익 증감률',
                         '매출액', '매출액 증감', '매출액 증감률',
-                    ]].copy()
-                    
+                    ]]
+
                     label_header = '월' if time_agg_type == '월별' else '년분기'
                     df_trend_raw.rename(columns={'display_label': label_header}, inplace=True)
                     
                 else:
-                    df_trend_target.rename(columns={'영업이익': '영업이익', '매출액': '매출액'}, inplace=True)
-                    df_trend_raw = df_trend_target.drop(columns=['기간']).copy()
+                    df_trend_raw = df_trend_target.drop(columns=['기간'])
                     label_header = '월' if time_agg_type == '월별' else '년분기'
                     df_trend_raw.rename(columns={'display_label': label_header}, inplace=True)
 
 
-                # 데이터 포맷팅 (추이 테이블)
-                df_trend_display = df_trend_raw.copy()
-                currency_cols_trend = [col for col in df_trend_display.columns if '영업이익' in col or '매출액' in col]
-                rate_cols_trend = [col for col in df_trend_display.columns if '증감률' in col]
-                
-                for col in currency_cols_trend:
-                    if col in rate_cols_trend: continue
-                    df_trend_display[col] = df_trend_display[col].apply(
-                        lambda x: format_currency(x, display_unit, display_divisor)
-                    )
+                # 데이터 포맷팅 (추이 테이블) — 원본 복사 후 덮어쓰는 대신 포맷된 컬럼으로 바로 조립
+                # 컬럼 분류는 한 번의 패스로 (증감률이 통화 분류에 섞이지 않도록 먼저 판정)
+                currency_only_cols_trend, rate_cols_trend = [], []
+                for col in df_trend_raw.columns:
+                    if '증감률' in col:
+                        rate_cols_trend.append(col)
+                    elif '영업이익' in col or '매출액' in col:
+                        currency_only_cols_trend.append(col)
 
-                for col in rate_cols_trend:
-                    df_trend_display[col] = df_trend_display[col].apply(
-                        lambda x: f"{x:,.1f} %" if not pd.isna(x) and x != np.inf else ('N/A' if x == 0 else 'Inf %')
+                out_cols = {col: df_trend_raw[col] for col in df_trend_raw.columns}
+                if currency_only_cols_trend:
+                    formatted_block = format_currency_block(
+                        df_trend_raw[currency_only_cols_trend], display_unit, display_divisor
                     )
+                    for col in currency_only_cols_trend:
+                        out_cols[col] = formatted_block[col]
+                for col in rate_cols_trend:
+                    out_cols[col] = format_rate_series(df_trend_raw[col])
+                df_trend_display = pd.DataFrame(out_cols)
 
                 st.dataframe(df_trend_display, use_container_width=True)
                 
                 # 추이 데이터 저장 (엑셀 다운로드용)
-                df_trend_for_export = df_trend_raw.copy()
+                df_trend_for_export = df_trend_raw
                 
                 st.markdown("---")
                 
@@ -1490,28 +1734,36 @@ else:
                 
                 col_download1, col_download2 = st.columns(2)
                 
+                # 비용 분석 데이터도 포함 (있을 경우, 표시용과 같은 캐시 항목을 공유)
+                cost_df_for_export = None
+                if existing_cost_cols:
+                    cost_df_for_export = compute_cost_breakdown(
+                        df, tuple(selected_years), tuple(selected_months), comp_key, filter_key,
+                        tuple(existing_cost_cols)
+                    )
+
+                # 엑셀/HTML 리포트를 한 번에 병렬 생성 (캐시 미스일 때만 실제 작업)
+                excel_file = None
+                html_report = None
+                try:
+                    excel_file, html_report = build_reports(
+                        df_summary_for_export, df_trend_for_export, cost_df_for_export,
+                        total_revenue_target, total_cost_target, operating_profit_target,
+                        total_revenue_comp, total_cost_comp, operating_profit_comp,
+                        delta_revenue if is_comparison_active else 0,
+                        delta_cost if is_comparison_active else 0,
+                        delta_profit if is_comparison_active else 0,
+                        target_label, comparison_year, display_unit, display_divisor,
+                        insights,
+                    )
+                except Exception as e:
+                    st.error(f"리포트 생성 중 오류 발생: {e}")
+
                 with col_download1:
                     # 엑셀 다운로드 버튼
-                    try:
-                        # 비용 분석 데이터도 포함 (있을 경우)
-                        cost_df_for_export = None
-                        if existing_cost_cols:
-                            cost_df_for_export = analyze_cost_breakdown(
-                                df_target=current_df,
-                                df_comparison=df_comparison if is_comparison_active else None,
-                                cost_columns=existing_cost_cols,
-                                display_divisor=1,  # Raw 값 사용
-                                display_unit=" 원"
-                            )
-                        
-                        excel_file = create_excel_report(
-                            df_summary=df_summary_for_export,
-                            df_trend=df_trend_for_export,
-                            df_cost_analysis=cost_df_for_export
-                        )
-                        
+                    if excel_file is not None:
                         filename_excel = f"손익분석_{target_years_display}년_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                        
+
                         st.download_button(
                             label="📊 엑셀 파일 다운로드",
                             data=excel_file,
@@ -1520,33 +1772,12 @@ else:
                             help="상세 손익 내역과 추이 데이터를 엑셀 파일로 다운로드합니다.",
                             use_container_width=True
                         )
-                    except Exception as e:
-                        st.error(f"엑셀 파일 생성 중 오류 발생: {e}")
-                
+
                 with col_download2:
                     # HTML 리포트 다운로드 버튼
-                    try:
-                        html_report = create_html_report(
-                            total_revenue_target=total_revenue_target,
-                            total_cost_target=total_cost_target,
-                            operating_profit_target=operating_profit_target,
-                            total_revenue_comp=total_revenue_comp,
-                            total_cost_comp=total_cost_comp,
-                            operating_profit_comp=operating_profit_comp,
-                            delta_revenue=delta_revenue if is_comparison_active else 0,
-                            delta_cost=delta_cost if is_comparison_active else 0,
-                            delta_profit=delta_profit if is_comparison_active else 0,
-                            target_label=target_label,
-                            comparison_year=comparison_year,
-                            display_unit=display_unit,
-                            display_divisor=display_divisor,
-                            df_summary=df_summary_for_export,
-                            df_trend=df_trend_for_export,
-                            insights=insights
-                        )
-                        
+                    if html_report is not None:
                         filename_html = f"손익분석리포트_{target_years_display}년_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-                        
+
                         st.download_button(
                             label="📧 HTML 리포트 다운로드",
                             data=html_report,
@@ -1555,8 +1786,6 @@ else:
                             help="이메일 첨부용 HTML 리포트를 다운로드합니다.",
                             use_container_width=True
                         )
-                    except Exception as e:
-                        st.error(f"HTML 리포트 생성 중 오류 발생: {e}")
                 
                 st.markdown("---")
                 
@@ -1567,51 +1796,65 @@ else:
                     st.markdown(f"### 📈 월별 매출액 추이 그래프 ({mode_label}, 단위: {selected_unit_label})") 
                     
                     # 1. 그래프용 데이터 준비
-                    df_plot_target = aggregate_profit_trend(df_trend_base, time_col, sort_col, is_cumulative, target_label_full)
-                    df_plot_target['매출액_Scaled'] = df_plot_target['매출액'] / display_divisor
-                    
-                    # 선택 월 강조용 마커 (실제 선택된 월만)
-                    df_plot_target_markers_raw = aggregate_profit_trend(df_target, time_col, sort_col, is_cumulative, target_label_full)
-                    df_plot_target_markers = df_plot_target_markers_raw.copy()
-                    df_plot_target_markers['매출액_Scaled'] = df_plot_target_markers['매출액'] / display_divisor
-                    
-                    
-                    fig = go.Figure()
-
-                    # A. 주요기간 (Target) 라인 Trace
-                    fig.add_trace(go.Scatter(
-                        x=df_plot_target['display_label'],
-                        y=df_plot_target['매출액_Scaled'],
-                        mode='lines',
+                    # 추이 테이블이 같은 인자로 이미 집계한 결과를 그대로 재사용
+                    # (이후 코드는 읽기 전용이므로 복사/재집계 불필요)
+                    df_plot_target = df_trend_target
+                    # 스케일링은 numpy 배열로 한 번만 수행해 trace에 바로 전달
+                    # (그래프 픽셀 해상도에는 float32면 충분 — 직렬화 바이트 절반)
+                    label_target = df_plot_target['display_label'].to_numpy()
+                    scaled_target = (df_plot_target['매출액'].to_numpy() / display_divisor).astype(np.float32)
+
+                    # 선택 월 강조용 마커 라벨 (실제 선택된 월만)
+                    df_plot_target_markers = aggregate_profit_trend(df_target, time_col, sort_col, is_cumulative, target_label_full)
+                    n_markers = 0 if df_plot_target_markers is None else len(df_plot_target_markers)
+
+
+                    # 포인트가 캔버스 해상도를 크게 넘으면 LTTB 다운샘플링으로 전송량 축소
+                    if FigureResampler is not None and len(df_plot_target) > 1000:
+                        fig = FigureResampler(go.Figure())
+                    else:
+                        fig = go.Figure()
+
+                    # 포인트가 많으면 SVG 대신 WebGL(Scattergl)로 렌더링
+                    trace_cls = go.Scattergl if len(df_plot_target) >= 500 else go.Scatter
+
+                    # A+B. 주요기간 라인 + 선택 월 강조를 한 trace로 통합
+                    # (선택 월만 size>0 마커로 표시 — trace 수/페이로드 절반)
+                    # 선택 월이 없거나 전 구간이면 isin/크기 배열 계산을 생략
+                    if n_markers == 0:
+                        trace_mode = 'lines'
+                        marker_sizes = 0
+                    elif n_markers >= len(df_plot_target):
+                        trace_mode = 'lines+markers'
+                        marker_sizes = 10
+                    else:
+                        trace_mode = 'lines+markers'
+                        label_markers = df_plot_target_markers['display_label'].to_numpy()
+                        marker_sizes = np.where(np.isin(label_target, label_markers), 10, 0)
+                    fig.add_trace(trace_cls(
+                        x=label_target,
+                        y=scaled_target,
+                        mode=trace_mode,
                         name=target_label_full,
-                        line=dict(color='blue', width=3)
-                    ))
-
-                    # B. 선택 월 강조 (Target Markers) Scatter Trace
-                    # 선택된 월에만 마커 표시
-                    fig.add_trace(go.Scatter(
-                        x=df_plot_target_markers['display_label'],
-                        y=df_plot_target_markers['매출액_Scaled'],
-                        mode='markers',
-                        name='선택 월 강조',
-                        showlegend=False, # 범례에서 숨김
+                        line=dict(color='blue', width=3),
                         marker=dict(
-                            size=10, 
-                            color='blue', 
+                            size=marker_sizes,
+                            color='blue',
                             line=dict(width=2, color='DarkSlateGrey')
                         ),
-                        hoverinfo='text',
-                        text=[f"{y:,.1f} {selected_unit_label}" for y in df_plot_target_markers['매출액_Scaled'].tolist()]
+                        # 포인트별 텍스트 리스트 대신 포맷을 브라우저(hovertemplate)로 위임
+                        hovertemplate=f"%{{y:,.1f}} {selected_unit_label}<extra></extra>"
                     ))
 
                     # C. 비교기간 (Comparison) 라인 Trace
                     if is_comparison_active and df_trend_comp is not None:
                         df_plot_comp = aggregate_profit_trend(df_comp_trend_base, time_col, sort_col, is_cumulative, comp_label_full)
-                        df_plot_comp['매출액_Scaled'] = df_plot_comp['매출액'] / display_divisor
-                        
-                        fig.add_trace(go.Scatter(
-                            x=df_plot_comp['display_label'],
-                            y=df_plot_comp['매출액_Scaled'],
+                        label_comp = df_plot_comp['display_label'].to_numpy()
+                        scaled_comp = (df_plot_comp['매출액'].to_numpy() / display_divisor).astype(np.float32)
+
+                        fig.add_trace(trace_cls(
+                            x=label_comp,
+                            y=scaled_comp,
                             mode='lines',
                             name=comp_label_full,
                             line=dict(color='black', dash='dash', width=2) # 검은색, 점선으로 표시
@@ -1639,11 +1882,12 @@ else:
                 elif time_agg_type == "분기별":
                     # --- 분기별: Year-Over-Year 비교 그래프 ---
                     
-                    # 동적 필터가 적용된 데이터로 그래프 생성
-                    df_filtered_for_graph = df.copy()
-                    for filter_col, filter_values in selected_filter_values.items():
-                        if filter_values:
-                            df_filtered_for_graph = df_filtered_for_graph[df_filtered_for_graph[filter_col].isin(filter_values)]
+                    # 동적 필터가 적용된 데이터로 그래프 생성 (마스크 하나로 합쳐 한 번만 인덱싱)
+                    graph_masks = [
+                        df[filter_col].isin(filter_values).to_numpy()
+                        for filter_col, filter_values in selected_filter_values.items() if filter_values
+                    ]
+                    df_filtered_for_graph = df[np.logical_and.reduce(graph_masks)] if graph_masks else df
                     
                     # 새로운 Yo-Y 그래프 함수 호출
                     plot_quarterly_yoy_revenue(